@@ -55,7 +55,13 @@ export const handleNewMessage = async (req, res) => {
   } catch (error) {
     console.error("[Controller] Lỗi khi xử lý tin nhắn:", error.message);
 
-    if (error.message.startsWith("Lỗi từ Python Service:") || error.message.startsWith("Không thể kết nối")) {
+    if (error.retryAfter) {
+       res.set('Retry-After', error.retryAfter);
+    }
+
+    if (error.status === 504) {
+       res.status(504).json({ error: `Dịch vụ AI không trả lời kịp thời hạn: ${error.message}` });
+    } else if (error.message.startsWith("Lỗi từ Python Service:") || error.message.startsWith("Không thể kết nối")) {
        res.status(503).json({ error: `Không thể nhận câu trả lời từ dịch vụ AI: ${error.message}` })
     } else if (error.message.startsWith("Phản hồi không hợp lệ")) {
         res.status(502).json({ error: `Dịch vụ AI trả về phản hồi không mong muốn.` }); 
@@ -8,6 +8,12 @@ const __dirname = path.dirname(__filename);
 dotenv.config({ path: path.resolve(__dirname, '..', '..', '.env') });
 
 const PYTHON_API_BASE_URL = process.env.PYTHON_API_URL;
+const parsedTimeoutMs = parseInt(process.env.PYTHON_TIMEOUT_MS, 10);
+const PYTHON_TIMEOUT_MS = Number.isNaN(parsedTimeoutMs) ? 60000 : parsedTimeoutMs;
+// Ngân sách còn lại (ms) gửi cho Python để dừng xử lý khi backend đã bỏ cuộc.
+// Trừ hao một khoảng cho mạng và việc trả kết quả về.
+const DEADLINE_HEADER = 'X-Request-Deadline-Ms';
+const DEADLINE_MARGIN_MS = 500;
 
 if (!PYTHON_API_BASE_URL) {
   console.error("Lỗi: Biến môi trường PYTHON_API_URL chưa được đặt!");
@@ -25,8 +31,9 @@ const getRagResponse = async (query) => {
     }, {
       headers: {
         'Content-Type': 'application/json',
+        [DEADLINE_HEADER]: String(Math.max(PYTHON_TIMEOUT_MS - DEADLINE_MARGIN_MS, 0)),
       },
-       timeout: 60000 
+       timeout: PYTHON_TIMEOUT_MS 
     });
 
     if (response.data && response.data.answer) {
@@ -44,7 +51,11 @@ const getRagResponse = async (query) => {
     if (error.response) {
       console.error(`[PythonService] Lỗi từ server Python (${error.response.status}):`, error.response.data);
       const pythonErrorMsg = error.response.data?.error || `Lỗi ${error.response.status} từ server Python`;
-      throw new Error(`Lỗi từ Python Service: ${pythonErrorMsg}`);
+      const serviceError = new Error(`Lỗi từ Python Service: ${pythonErrorMsg}`);
+      // Giữ lại mã lỗi quá tải/hết hạn và Retry-After để controller trả về cho client
+      serviceError.status = error.response.status;
+      serviceError.retryAfter = error.response.headers?.['retry-after'];
+      throw serviceError;
     } else if (error.request) {
       console.error("[PythonService] Không nhận được phản hồi từ server Python.");
       throw new Error("Không thể kết nối đến dịch vụ Python.");
@@ -1,9 +1,13 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
 from flask_cors import CORS 
 from services.retriever import RetrieverService
+from services.sharded_retriever import ShardedRetrieverService
+from services.shard_coordinator import SHARD_ENDPOINTS
 from services.generator import GeneratorService 
+from services.admission import AdmissionController, AdmissionRejected, Deadline, DeadlineExceeded, StageBudget, run_with_deadline
 from deep_translator import GoogleTranslator
 from langdetect import detect
 
@@ -15,8 +19,12 @@ CORS(app)
 logging.info("Ứng dụng Flask đang được khởi tạo...")
 
 try:
-    logging.info("Đang khởi tạo RetrieverService...")
-    retriever = RetrieverService()
+    if SHARD_ENDPOINTS:
+        logging.info(f"Đang khởi tạo ShardedRetrieverService ({len(SHARD_ENDPOINTS)} shard)...")
+        retriever = ShardedRetrieverService()
+    else:
+        logging.info("Đang khởi tạo RetrieverService...")
+        retriever = RetrieverService()
     logging.info("RetrieverService đã sẵn sàng.")
 except Exception as e:
     logging.error(f"LỖI NGHIÊM TRỌNG: Không thể khởi tạo RetrieverService: {e}", exc_info=True)
@@ -36,11 +44,45 @@ except Exception as e:
     logging.error(f"LỖI NGHIÊM TRỌNG: Không thể khởi tạo GeneratorService: {e}", exc_info=True)
     generator = None 
 
+admission = AdmissionController()
+stage_budget = StageBudget()
+# GoogleTranslator không nhận timeout: chạy trong pool riêng và chỉ chờ tới deadline
+translate_pool = ThreadPoolExecutor(max_workers=2 * admission.max_concurrent, thread_name_prefix='translate')
+logging.info(f"Admission control: tối đa {admission.max_concurrent} request đồng thời, hàng đợi {admission.max_queued}, chờ tối đa {admission.queue_timeout}s.")
+
 
 # API endpoint
 @app.route('/chat', methods=['POST'])
 def handle_chat():
     logging.info("Nhận được yêu cầu tới /chat")
+    deadline = Deadline.from_headers(request.headers)
+    try:
+        # Retrieve luôn chạy (dịch thì chỉ khi câu hỏi là tiếng Việt), nên giữ lại đủ thời gian cho nó khi xếp hàng
+        with admission.admit(deadline, reserve=stage_budget.estimate('retrieve')):
+            return process_chat(deadline)
+    except AdmissionRejected as e:
+        logging.warning(f"{e}")
+        response = jsonify({"error": "Máy chủ đang quá tải, vui lòng thử lại sau."})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+    except DeadlineExceeded as e:
+        if e.stage != 'queue':
+            admission.record_expired(e.stage)
+        logging.warning(f"Huỷ xử lý /chat: {e}")
+        return jsonify({"error": "Hết thời gian xử lý yêu cầu."}), 504
+
+
+@app.route('/metrics', methods=['GET'])
+def handle_metrics():
+    return jsonify({"admission": admission.snapshot(), "stage_seconds": stage_budget.snapshot()})
+
+
+def translate(text, source, target, deadline):
+    translator = GoogleTranslator(source=source, target=target)
+    return run_with_deadline(translate_pool, deadline, 'translate', translator.translate, text)
+
+
+def process_chat(deadline):
     if not retriever:
         logging.error("RetrieverService không khả dụng.")
         return jsonify({"error": "Dịch vụ tìm kiếm không khả dụng."}), 503 
@@ -68,12 +110,18 @@ def handle_chat():
     # Dịch câu hỏi sang tiếng Anh nếu cần
     if detected_language == 'vi':
         logging.info("Phát hiện ngôn ngữ đầu vào là tiếng Việt. Đang dịch sang tiếng Anh...")
-        query = GoogleTranslator(source='vi', target='en').translate(query)
+        stage_budget.check(deadline, 'translate')
+        with stage_budget.measure('translate'):
+            query = translate(query, 'vi', 'en', deadline)
         logging.info(f"Câu hỏi sau khi dịch sang tiếng Anh: '{query}'")
 
     try:
         logging.info("Bắt đầu quá trình Retrieve...")
-        retrieved_results = retriever.retrieve(query, top_k=3, fetch_context=True)
+        stage_budget.check(deadline, 'retrieve')
+        with stage_budget.measure('retrieve'):
+            retrieved_results = retriever.retrieve(query, top_k=3, fetch_context=True, deadline=deadline)
+            # Retrieve bị cắt ngắn vì hết hạn thì trả 504 thay vì tiếp tục với kết quả thiếu
+            deadline.check('retrieve')
 
         contexts = [result.get('context', '') for result in retrieved_results if result.get('context')]
         
@@ -94,16 +142,24 @@ def handle_chat():
              return jsonify({"error": "Không thể kết nối đến dịch vụ sinh câu trả lời (vấn đề API key?)."}), 503
 
         logging.info("Bắt đầu quá trình Generate...")
-        final_answer = generator.generate_response(query, contexts) 
+        stage_budget.check(deadline, 'generate')
+        with stage_budget.measure('generate'):
+            final_answer = generator.generate_response(query, contexts, deadline=deadline)
+            # Gemini bị ngắt vì hết hạn thì final_answer chỉ là thông báo lỗi, không trả về như câu trả lời
+            deadline.check('generate')
 
         # Dịch câu trả lời sang tiếng Việt nếu ngôn ngữ đầu vào là tiếng Việt
         if detected_language == 'vi':
             logging.info("Dịch câu trả lời từ tiếng Anh sang tiếng Việt...")
-            final_answer = GoogleTranslator(source='en', target='vi').translate(final_answer)
+            stage_budget.check(deadline, 'translate')
+            with stage_budget.measure('translate'):
+                final_answer = translate(final_answer, 'en', 'vi', deadline)
 
         logging.info(f"Câu trả lời được tạo: '{final_answer[:100]}...'") 
         return jsonify({"answer": final_answer})
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(f"Đã xảy ra lỗi không mong muốn khi xử lý '/chat': {e}", exc_info=True)
         return jsonify({"error": "Đã xảy ra lỗi máy chủ nội bộ."}), 500
@@ -0,0 +1,96 @@
+# Benchmark scatter-gather retrieval theo số shard.
+# Tạo một corpus embedding ngẫu nhiên, chia thành N shard, khởi động N shard worker cục bộ
+# rồi bắn các truy vấn đồng thời qua ShardCoordinator để đo QPS và độ trễ (p50/p95/p99).
+#
+# Chạy (từ thư mục python/):
+#   python benchmark_shards.py --docs 200000 --shards 1 2 4 8 --queries 500 --concurrency 8
+
+import time
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from services.shard_store import write_shards
+from services.shard_worker import launch_local_workers, wait_until_ready, stop_local_workers
+from services.shard_coordinator import ShardCoordinator
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def make_corpus(num_docs: int, dim: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num_docs, dim)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # ID giả dạng ObjectId (24 ký tự hex)
+    mongo_ids = [f'{i:024x}' for i in range(num_docs)]
+    return embeddings, mongo_ids
+
+
+def run_load(coordinator: ShardCoordinator, queries: np.ndarray, top_k: int, concurrency: int) -> dict:
+    def one(query):
+        started = time.perf_counter()
+        _, missing_shards = coordinator.search(query, top_k)
+        return time.perf_counter() - started, bool(missing_shards)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, queries))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.array([latency for latency, _ in outcomes]) * 1000
+    return {
+        'qps': len(queries) / elapsed,
+        'p50': float(np.percentile(latencies_ms, 50)),
+        'p95': float(np.percentile(latencies_ms, 95)),
+        'p99': float(np.percentile(latencies_ms, 99)),
+        'partial': sum(1 for _, partial in outcomes if partial),
+    }
+
+
+def benchmark(num_docs: int, dim: int, shard_counts: list, num_queries: int, top_k: int, concurrency: int, base_port: int, timeout: float) -> list:
+    embeddings, mongo_ids = make_corpus(num_docs, dim)
+    queries = make_corpus(num_queries, dim, seed=1)[0]
+
+    rows = []
+    for num_shards in shard_counts:
+        with tempfile.TemporaryDirectory(prefix=f'shards_{num_shards}_') as shard_dir:
+            write_shards(embeddings, mongo_ids, num_shards, shard_dir)
+            processes, endpoints = launch_local_workers(num_shards, base_port, shard_dir)
+            coordinator = None
+            try:
+                if not wait_until_ready(endpoints):
+                    logging.error(f"Bỏ qua {num_shards} shard: worker không khởi động được.")
+                    continue
+                coordinator = ShardCoordinator(endpoints, timeout=timeout, max_workers=concurrency * num_shards)
+                run_load(coordinator, queries[:min(50, num_queries)], top_k, concurrency)  # warm-up
+                stats = run_load(coordinator, queries, top_k, concurrency)
+                stats['shards'] = num_shards
+                rows.append(stats)
+                logging.info(f"{num_shards} shard: {stats['qps']:.1f} QPS, p50={stats['p50']:.1f}ms, p95={stats['p95']:.1f}ms")
+            finally:
+                if coordinator:
+                    coordinator.close()
+                stop_local_workers(processes)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Đo QPS và độ trễ của retrieval theo số shard.")
+    parser.add_argument('--docs', type=int, default=200000, help="Số vector trong corpus giả lập.")
+    parser.add_argument('--dim', type=int, default=384, help="Kích thước vector (all-MiniLM-L6-v2: 384).")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5101, help="Port của shard đầu tiên.")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Timeout mỗi truy vấn (giây).")
+    args = parser.parse_args()
+
+    rows = benchmark(args.docs, args.dim, args.shards, args.queries, args.top_k, args.concurrency, args.port, args.timeout)
+
+    print(f"\nCorpus: {args.docs} vector x {args.dim} chiều, {args.queries} truy vấn, concurrency={args.concurrency}, top_k={args.top_k}")
+    print(f"{'shards':>6} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'partial':>8}")
+    for row in rows:
+        print(f"{row['shards']:>6} {row['qps']:>8.1f} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} {row['partial']:>8}")
@@ -0,0 +1,249 @@
+# Admission control và deadline cho /chat.
+# - AdmissionController: giới hạn số request xử lý đồng thời và độ dài hàng đợi; hàng đợi đầy hoặc chờ quá lâu
+#   thì từ chối ngay (503 + Retry-After) thay vì để độ trễ của mọi request cùng tăng.
+# - Deadline: thời hạn do backend Node gửi qua header; được kiểm tra giữa các bước của pipeline
+#   (dịch, retrieve, generate) để dừng sớm khi ngân sách còn lại không đủ cho bước tiếp theo.
+# - StageBudget: ước lượng thời gian mỗi bước (EWMA) để biết "không đủ" là bao nhiêu.
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Ngân sách thời gian còn lại (ms) của request, tính từ lúc backend gửi đi
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "4"))
+MAX_QUEUED_CHATS = int(os.getenv("MAX_QUEUED_CHATS", "16"))
+# Thời gian chờ tối đa trong hàng đợi trước khi trả 503. Ngắn thì client bị từ chối nhanh và tự thử lại theo
+# Retry-After; dài thì hấp thụ được đợt tăng tải ngắn nhưng request bị từ chối phải chờ lâu mới biết.
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "2.0"))
+
+# Ước lượng ban đầu (giây) cho từng bước, trước khi có số đo thực tế
+DEFAULT_STAGE_SECONDS = {
+    'translate': float(os.getenv("STAGE_TRANSLATE_SECONDS", "1.0")),
+    'retrieve': float(os.getenv("STAGE_RETRIEVE_SECONDS", "1.0")),
+    'generate': float(os.getenv("STAGE_GENERATE_SECONDS", "5.0")),
+}
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str, remaining: float, needed: float = 0.0):
+        super().__init__(f"Hết thời hạn ở bước '{stage}' (còn {remaining:.2f}s, cần ~{needed:.2f}s)")
+        self.stage = stage
+        self.remaining = remaining
+        self.needed = needed
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int, status: int = 503):
+        super().__init__(f"Từ chối request ({reason}), thử lại sau {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class Deadline:
+    def __init__(self, expires_at: float = None):
+        # Thời điểm hết hạn theo time.monotonic(); None = không giới hạn
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_headers(cls, headers, header: str = DEADLINE_HEADER) -> 'Deadline':
+        value = headers.get(header)
+        if not value:
+            return cls()
+        try:
+            budget_ms = float(value)
+        except ValueError:
+            budget_ms = math.nan
+        # nan/inf/âm: không phải ngân sách hợp lệ (nan còn khiến mọi phép so sánh luôn sai, request không bao giờ hết hạn)
+        if not math.isfinite(budget_ms) or budget_ms < 0:
+            logging.warning(f"Header {header} không hợp lệ: '{value}', bỏ qua deadline.")
+            return cls()
+        return cls(time.monotonic() + budget_ms / 1000)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return self.expires_at - time.monotonic()
+
+    def check(self, stage: str, needed: float = 0.0):
+        """Raise DeadlineExceeded nếu thời gian còn lại không đủ cho bước `stage`."""
+        remaining = self.remaining()
+        if remaining <= needed:
+            raise DeadlineExceeded(stage, remaining, needed)
+
+
+class StageBudget:
+    def __init__(self, defaults: dict = DEFAULT_STAGE_SECONDS, alpha: float = 0.2):
+        self.alpha = alpha
+        self._estimates = dict(defaults)
+        self._lock = threading.Lock()
+
+    def estimate(self, stage: str) -> float:
+        with self._lock:
+            return self._estimates.get(stage, 0.0)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            previous = self._estimates.get(stage)
+            self._estimates[stage] = seconds if previous is None else (1 - self.alpha) * previous + self.alpha * seconds
+
+    def check(self, deadline: Deadline, stage: str):
+        deadline.check(stage, self.estimate(stage))
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.monotonic()
+        expired = False
+        try:
+            yield
+        except DeadlineExceeded:
+            # Bước bị cắt ngang vì hết hạn: thời gian đo được không phản ánh thời gian thật của bước
+            expired = True
+            raise
+        finally:
+            if not expired:
+                self.observe(stage, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {stage: round(seconds, 3) for stage, seconds in self._estimates.items()}
+
+
+def run_with_deadline(executor, deadline: Deadline, stage: str, fn, *args, **kwargs):
+    """Chạy fn trong executor và chỉ chờ tới deadline; hết hạn thì raise DeadlineExceeded.
+
+    Dùng cho các lời gọi không nhận timeout (ví dụ GoogleTranslator): fn có thể vẫn chạy nốt trong executor,
+    nhưng request trả lời ngay và nhả slot admission.
+    """
+    future = executor.submit(fn, *args, **kwargs)
+    remaining = deadline.remaining()
+    try:
+        return future.result(timeout=None if math.isinf(remaining) else max(remaining, 0))
+    except FutureTimeout:
+        future.cancel()
+        raise DeadlineExceeded(stage, deadline.remaining())
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_CHATS, max_queued: int = MAX_QUEUED_CHATS, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        # Thời gian xử lý trung bình (EWMA) để ước lượng Retry-After
+        self._service_seconds = sum(DEFAULT_STAGE_SECONDS.values())
+
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0}
+        self.expired = {}
+        self._queue_waits = deque(maxlen=1000)
+
+    def _retry_after(self) -> int:
+        # Thời gian để những request đang chờ phía trước được xử lý xong
+        backlog = self._queued + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_concurrent))
+
+    def _expire_in_queue(self, deadline: Deadline, reserve: float):
+        self.expired['queue'] = self.expired.get('queue', 0) + 1
+        raise DeadlineExceeded('queue', deadline.remaining(), reserve)
+
+    def acquire(self, deadline: Deadline, reserve: float = 0.0):
+        """Chờ tới lượt xử lý; raise AdmissionRejected / DeadlineExceeded nếu không được nhận.
+
+        `reserve` là thời gian cần cho bước đầu tiên sau khi được nhận: request chỉ chờ trong hàng đợi
+        khi còn đủ ngân sách cho bước đó, tránh chiếm slot rồi hết hạn ngay ở lần kiểm tra đầu tiên.
+        """
+        with self._cond:
+            if deadline.remaining() - reserve <= 0:
+                self._expire_in_queue(deadline, reserve)
+
+            if self._in_flight < self.max_concurrent and self._queued == 0:
+                self._in_flight += 1
+                self.admitted += 1
+                self._queue_waits.append(0.0)
+                return
+
+            if self._queued >= self.max_queued:
+                self.rejected['queue_full'] += 1
+                raise AdmissionRejected('queue_full', self._retry_after())
+
+            started = time.monotonic()
+            wait_limit = min(self.queue_timeout, deadline.remaining() - reserve)
+            self._queued += 1
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    left = wait_limit - (time.monotonic() - started)
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+            finally:
+                self._queued -= 1
+
+            waited = time.monotonic() - started
+            self._queue_waits.append(waited)
+            if self._in_flight >= self.max_concurrent:
+                if deadline.remaining() - reserve <= 0:
+                    self._expire_in_queue(deadline, reserve)
+                self.rejected['queue_timeout'] += 1
+                raise AdmissionRejected('queue_timeout', self._retry_after())
+
+            self._in_flight += 1
+            self.admitted += 1
+
+    def release(self, service_seconds: float):
+        with self._cond:
+            self._in_flight -= 1
+            self.completed += 1
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, deadline: Deadline, reserve: float = 0.0):
+        self.acquire(deadline, reserve)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def record_expired(self, stage: str):
+        with self._cond:
+            self.expired[stage] = self.expired.get(stage, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            waits_ms = sorted(w * 1000 for w in self._queue_waits)
+
+            def percentile(p):
+                if not waits_ms:
+                    return 0.0
+                return round(waits_ms[min(len(waits_ms) - 1, int(p / 100 * len(waits_ms)))], 1)
+
+            return {
+                'in_flight': self._in_flight,
+                'queued': self._queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'completed': self.completed,
+                'rejected': dict(self.rejected),
+                'expired': dict(self.expired),
+                'queue_wait_ms': {
+                    'p50': percentile(50),
+                    'p95': percentile(95),
+                    'max': round(waits_ms[-1], 1) if waits_ms else 0.0,
+                },
+            }
@@ -61,7 +61,7 @@ class GeneratorService:
         logging.debug(f"Prompt được tạo (độ dài: {len(prompt)} chars)")
         return prompt
 
-    def generate_response(self, query: str, context: list, max_retries=2, initial_delay=1) -> str:
+    def generate_response(self, query: str, context: list, max_retries=2, initial_delay=1, deadline=None) -> str:
         if not self.api_key_configured:
              logging.error("Không thể tạo phản hồi: API Key của Google chưa được cấu hình.")
              return "Lỗi: API Key của Google chưa được cấu hình."
@@ -89,10 +89,16 @@ class GeneratorService:
                     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
                 ]
 
+                request_options = None
+                if deadline is not None and deadline.expires_at is not None:
+                    # Không chờ Gemini lâu hơn thời hạn còn lại của request
+                    request_options = {"timeout": max(deadline.remaining(), 0.1)}
+
                 response = self.model.generate_content(
                     prompt,
                     generation_config=generation_config,
-                    safety_settings=safety_settings
+                    safety_settings=safety_settings,
+                    request_options=request_options
                 )
 
                 if not response.candidates:
@@ -114,9 +120,16 @@ class GeneratorService:
                 return answer 
 
             except Exception as e:
+                if deadline is not None and deadline.remaining() <= 0:
+                    logging.warning(f"Hết thời hạn của request khi gọi Google Gemini: {e}")
+                    return "Lỗi: Hết thời gian chờ phản hồi từ Google Gemini."
+
                 error_str = str(e).lower()
                 if "429" in error_str or "resource has been exhausted" in error_str or "rate limit" in error_str:
-                    if retries < max_retries:
+                    if deadline is not None and deadline.remaining() <= delay:
+                        logging.error(f"Gặp lỗi Rate Limit Google Gemini (429) và không còn đủ thời gian để thử lại.")
+                        return "Lỗi: Đã đạt giới hạn yêu cầu miễn phí của Google Gemini. Vui lòng thử lại sau."
+                    elif retries < max_retries:
                         logging.warning(f"Gặp lỗi Rate Limit Google Gemini (429). Đang chờ {delay} giây để thử lại...")
                         time.sleep(delay)
                         retries += 1
@@ -6,6 +6,7 @@
 # Trả về các _id hoặc nội dung của các đoạn mô tả liên quan đó. Đây chính là "ngữ cảnh" (context) mà chúng ta sẽ cung cấp cho LLM ở bước sau.
 
 import os
+import math
 import faiss
 import numpy as np
 import pickle
@@ -56,14 +57,11 @@ class RetrieverService:
         self.db = None
         self.collection = None
 
-        try:
-            logging.info(f"Đang tải model embedding: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
-            logging.info(f"Model {self.model_name} đã tải xong.")
-        except Exception as e:
-            logging.error(f"Lỗi khi tải model embedding '{self.model_name}': {e}")
-            raise ValueError(f"Không thể tải model embedding: {e}")
+        self._load_model()
+        self._load_index()
+        self._connect_mongo()
 
+    def _load_index(self):
         try:
             logging.info(f"Đang tải FAISS index từ: {self.index_path}")
             if not os.path.exists(self.index_path):
@@ -88,6 +86,16 @@ class RetrieverService:
             logging.error(f"Lỗi khi tải ID mapping: {e}")
             raise RuntimeError(f"Không thể tải ID mapping: {e}")
 
+    def _load_model(self):
+        try:
+            logging.info(f"Đang tải model embedding: {self.model_name}")
+            self.model = SentenceTransformer(self.model_name)
+            logging.info(f"Model {self.model_name} đã tải xong.")
+        except Exception as e:
+            logging.error(f"Lỗi khi tải model embedding '{self.model_name}': {e}")
+            raise ValueError(f"Không thể tải model embedding: {e}")
+
+    def _connect_mongo(self):
         if self.mongo_uri and self.db_name:
             try:
                 logging.info(f"Đang kết nối tới MongoDB để fetch context: DB='{self.db_name}'")
@@ -105,15 +113,69 @@ class RetrieverService:
         else:
              logging.warning("Thiếu MONGO_URI hoặc DB_NAME, sẽ không fetch context từ MongoDB.")
 
+    def _fetch_context(self, mongo_id: str, timeout: float = None):
+        """Lấy câu trả lời của bác sĩ (hoặc câu hỏi nếu không có) làm context cho một document."""
+        try:
+            logging.info(f"  -> Đang tìm kiếm document _id='{mongo_id}' trong MongoDB...")
+            options = {}
+            if timeout is not None and math.isfinite(timeout):
+                options['max_time_ms'] = max(int(timeout * 1000), 1)
+            doc = self.collection.find_one({"_id": ObjectId(mongo_id)}, {"Description": 1, "Doctor": 1}, **options)
+
+            if doc:
+                logging.info(f"  -> Tìm thấy document!")
+                doctor_answer = doc.get('Doctor')
+                question = doc.get('Description')
+
+                if doctor_answer:
+                    logging.info(f"    -> Lấy 'Doctor' làm context: {doctor_answer[:100]}...")
+                    return doctor_answer
+                elif question:
+                    logging.warning(f"    -> Không có 'Doctor', dùng 'Description' làm context: {question[:100]}...")
+                    return question
+                else:
+                    logging.warning(f"    -> KHÔNG tìm thấy cả 'Doctor' và 'Description'!")
+                    return None
+            else:
+                logging.warning(f"  -> Không tìm thấy document trong MongoDB cho _id='{mongo_id}'.")
+                return None
+        except Exception as e:
+            logging.error(f"  -> Lỗi khi truy vấn MongoDB cho _id={mongo_id}: {e}", exc_info=True)
+            return None
 
-    def retrieve(self, query: str, top_k: int = 5, fetch_context: bool = True, threshold: float = 0.5) -> list:
-        if not query:
-            logging.warning("Query rỗng, không thực hiện tìm kiếm.")
-            return []
+
+    def _search(self, query_embedding, top_k: int, timeout: float = None) -> list:
+        """Tìm top_k kết quả [{'id', 'score'}] gần nhất, score giảm dần.
+
+        Lớp con (ví dụ ShardedRetrieverService) thay bằng nguồn tìm kiếm khác; `timeout` là thời gian tối đa được phép chờ.
+        """
         if self.index.ntotal == 0:
             logging.warning("Index FAISS rỗng, không có gì để tìm kiếm.")
             return []
 
+        logging.info(f"Đang tìm kiếm {top_k} kết quả gần nhất trong FAISS index...")
+        distances, indices = self.index.search(query_embedding, top_k)
+        logging.info(f"FAISS indices tìm thấy: {indices[0]}")
+
+        hits = []
+        for i, idx in enumerate(indices[0]):
+            if idx == -1:
+                logging.info(f"Kết quả {i+1}: FAISS Index={idx} (Không hợp lệ, bỏ qua).")
+                continue
+
+            mongo_id = self.id_mapping.get(idx)
+            if not mongo_id:
+                logging.warning(f"  -> Không tìm thấy MongoDB ID cho FAISS index {idx} trong mapping.")
+                continue
+
+            hits.append({'id': mongo_id, 'score': float(1.0 - distances[0][i])})  # Tính điểm tương đồng
+        return hits
+
+    def retrieve(self, query: str, top_k: int = 5, fetch_context: bool = True, threshold: float = 0.5, deadline=None) -> list:
+        if not query:
+            logging.warning("Query rỗng, không thực hiện tìm kiếm.")
+            return []
+
         logging.info(f"Đang tạo embedding cho query: '{query[:50]}...'")  # Log 50 ký tự đầu
         try:
             query_embedding = self.model.encode([query], convert_to_numpy=True).astype('float32')
@@ -121,57 +183,29 @@ class RetrieverService:
             logging.error(f"Lỗi khi tạo embedding cho query: {e}")
             return []
 
-        logging.info(f"Đang tìm kiếm {top_k} kết quả gần nhất trong FAISS index...")
         try:
-            distances, indices = self.index.search(query_embedding, top_k)
+            timeout = deadline.remaining() if deadline is not None else None
+            if timeout is not None and timeout <= 0:
+                logging.warning("Hết thời hạn của request, bỏ qua tìm kiếm.")
+                return []
+            hits = self._search(query_embedding, top_k, timeout=timeout)
 
             results = []
-            logging.info(f"FAISS indices tìm thấy: {indices[0]}")
-
-            for i, idx in enumerate(indices[0]):
-                if idx == -1:
-                    logging.info(f"Đang xử lý kết quả {i+1}: FAISS Index={idx} (Không hợp lệ, bỏ qua).")
-                    continue
-
-                mongo_id = self.id_mapping.get(idx)
-                score = 1.0 - distances[0][i]  # Tính điểm tương đồng
-
+            for i, hit in enumerate(hits):
+                score = hit['score']
                 if score < threshold:  # Bỏ qua các kết quả không đạt ngưỡng
                     logging.info(f"Kết quả {i+1} bị loại vì score={score:.4f} < threshold={threshold:.4f}.")
                     continue
 
-                logging.info(f"Đang xử lý kết quả {i+1}: FAISS Index={idx}, Score={score:.4f}")
-                if not mongo_id:
-                    logging.warning(f"  -> Không tìm thấy MongoDB ID cho FAISS index {idx} trong mapping.")
-                    continue
-
-                result_item = {'id': mongo_id, 'score': float(score)}
+                logging.info(f"Đang xử lý kết quả {i+1}: ID={hit['id']}, Score={score:.4f}")
+                result_item = {'id': hit['id'], 'score': float(score)}
 
                 if fetch_context and self.collection is not None:
-                    try:
-                        logging.info(f"  -> Đang tìm kiếm document _id='{mongo_id}' trong MongoDB...")
-                        doc = self.collection.find_one({"_id": ObjectId(mongo_id)}, {"Description": 1, "Doctor": 1})
-
-                        if doc:
-                            logging.info(f"  -> Tìm thấy document!")
-                            doctor_answer = doc.get('Doctor')
-                            question = doc.get('Description')
-
-                            if doctor_answer:
-                                logging.info(f"    -> Lấy 'Doctor' làm context: {doctor_answer[:100]}...")
-                                result_item['context'] = doctor_answer
-                            elif question:
-                                logging.warning(f"    -> Không có 'Doctor', dùng 'Description' làm context: {question[:100]}...")
-                                result_item['context'] = question
-                            else:
-                                logging.warning(f"    -> KHÔNG tìm thấy cả 'Doctor' và 'Description'!")
-                                result_item['context'] = None
-                        else:
-                            logging.warning(f"  -> Không tìm thấy document trong MongoDB cho _id='{mongo_id}'.")
-                            result_item['context'] = None
-                    except Exception as e:
-                        logging.error(f"  -> Lỗi khi truy vấn MongoDB cho _id={mongo_id}: {e}", exc_info=True)
-                        result_item['context'] = None
+                    remaining = deadline.remaining() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        logging.warning("Hết thời hạn của request, dừng fetch context.")
+                        break
+                    result_item['context'] = self._fetch_context(hit['id'], timeout=remaining)
 
                 results.append(result_item)
 
@@ -179,7 +213,7 @@ class RetrieverService:
             return results
 
         except Exception as e:
-            logging.error(f"Lỗi khi tìm kiếm trong FAISS index hoặc xử lý kết quả: {e}", exc_info=True)
+            logging.error(f"Lỗi khi tìm kiếm hoặc xử lý kết quả: {e}", exc_info=True)
             return []
     
     def close_connection(self):
@@ -0,0 +1,141 @@
+# Scatter-gather trên index đã chia shard (services/shard_store.py).
+# Gửi embedding của câu hỏi song song tới mọi shard worker (process cục bộ hoặc node từ xa qua HTTP),
+# gộp top-k của từng shard theo score và trả về top-k chung.
+# Shard chậm hoặc chết không chặn câu trả lời: sau SHARD_TIMEOUT giây coordinator trả về kết quả từ các shard đã trả lời.
+
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import requests
+from services.admission import MAX_CONCURRENT_CHATS
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Danh sách URL của các shard worker, cách nhau bởi dấu phẩy (ví dụ: http://10.0.0.1:5101,http://10.0.0.2:5101)
+SHARD_ENDPOINTS = [e.strip() for e in os.getenv("SHARD_ENDPOINTS", "").split(",") if e.strip()]
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "2.0"))
+
+
+class ShardTimeout(Exception):
+    pass
+
+
+class ShardCoordinator:
+    def __init__(self, endpoints: list, timeout: float = SHARD_TIMEOUT, max_workers: int = None):
+        if not endpoints:
+            raise ValueError("Cần ít nhất một shard endpoint.")
+        self.endpoints = [e.rstrip('/') for e in endpoints]
+        self.timeout = timeout
+        # Mỗi request /chat đang xử lý cần một thread cho mỗi shard. Nhân đôi để các thread còn kẹt ở shard chậm
+        # của request trước (tối đa ~timeout nữa) không làm các truy vấn tới shard khoẻ phải xếp hàng.
+        max_workers = max_workers or 2 * MAX_CONCURRENT_CHATS * len(self.endpoints)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard')
+        # Mỗi thread giữ một Session riêng để tái sử dụng kết nối HTTP tới worker
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _query_shard(self, endpoint: str, embedding: list, top_k: int, timeout: float) -> list:
+        # timeout của requests áp dụng riêng cho connect và cho từng lần đọc; đọc theo stream và tự kiểm tra
+        # tổng thời gian để shard trả dữ liệu nhỏ giọt không giữ thread mãi. Thread được giải phóng
+        # sau tối đa ~2 x timeout (connect + chờ byte đầu tiên); search() vẫn trả kết quả sau timeout.
+        started = time.monotonic()
+        with self._session().post(f'{endpoint}/search', json={'embedding': embedding, 'top_k': top_k},
+                                  timeout=(timeout, timeout), stream=True) as response:
+            response.raise_for_status()
+            body = bytearray()
+            while True:
+                # read1 trả về ngay khi có dữ liệu (iter_content chờ đủ cả chunk mới trả)
+                chunk = response.raw.read1(8192)
+                if not chunk:
+                    break
+                body.extend(chunk)
+                if time.monotonic() - started > timeout:
+                    raise ShardTimeout(f"Vượt quá {timeout}s khi đọc phản hồi từ {endpoint}")
+        return json.loads(body).get('results', [])
+
+    def search(self, query_embedding: np.ndarray, top_k: int, timeout: float = None) -> tuple:
+        """Tìm top_k kết quả trên mọi shard.
+
+        Trả về (results, missing_shards): results là [{'id', 'score'}] đã gộp, score giảm dần;
+        missing_shards là chỉ số các shard bị lỗi hoặc quá thời gian (kết quả khi đó chỉ là một phần).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        embedding = np.asarray(query_embedding, dtype='float32').reshape(-1).tolist()
+
+        futures = {
+            self.executor.submit(self._query_shard, endpoint, embedding, top_k, timeout): shard_id
+            for shard_id, endpoint in enumerate(self.endpoints)
+        }
+        done, not_done = wait(futures, timeout=timeout)
+
+        hits, missing_shards = [], []
+        for future in done:
+            shard_id = futures[future]
+            try:
+                hits.extend(future.result())
+            except Exception as e:
+                logging.warning(f"Shard {shard_id} ({self.endpoints[shard_id]}) lỗi: {e}")
+                missing_shards.append(shard_id)
+        for future in not_done:
+            shard_id = futures[future]
+            future.cancel()
+            logging.warning(f"Shard {shard_id} ({self.endpoints[shard_id]}) không trả lời sau {timeout}s, bỏ qua.")
+            missing_shards.append(shard_id)
+
+        results = heapq.nlargest(top_k, hits, key=lambda hit: hit['score'])
+        return results, sorted(missing_shards)
+
+    def verify_shards(self, timeout: float = 2.0) -> dict:
+        """Gọi /health của mọi endpoint và kiểm tra các shard_id phủ đúng 0..N-1.
+
+        Raise ValueError nếu cấu hình sai (shard trùng, shard_id ngoài khoảng, số shard khác lúc build);
+        endpoint không trả lời chỉ được cảnh báo vì có thể đang khởi động. Trả về {shard_id: endpoint}.
+        """
+        num_endpoints = len(self.endpoints)
+        shard_endpoints, errors = {}, []
+        for endpoint in self.endpoints:
+            try:
+                response = self._session().get(f'{endpoint}/health', timeout=timeout)
+                response.raise_for_status()
+                info = response.json()
+            except Exception as e:
+                logging.warning(f"Không kiểm tra được shard worker {endpoint}: {e}")
+                continue
+
+            shard_id = info.get('shard_id')
+            num_shards = info.get('num_shards')
+            if num_shards is not None and num_shards != num_endpoints:
+                errors.append(f"{endpoint} thuộc index {num_shards} shard nhưng SHARD_ENDPOINTS có {num_endpoints} endpoint")
+            if not isinstance(shard_id, int) or not 0 <= shard_id < num_endpoints:
+                errors.append(f"{endpoint} phục vụ shard {shard_id}, ngoài khoảng 0..{num_endpoints - 1}")
+            elif shard_id in shard_endpoints:
+                errors.append(f"Shard {shard_id} bị khai báo hai lần: {shard_endpoints[shard_id]} và {endpoint}")
+            else:
+                shard_endpoints[shard_id] = endpoint
+
+        if errors:
+            for error in errors:
+                logging.error(error)
+            raise ValueError(f"Cấu hình shard không hợp lệ: {'; '.join(errors)}")
+
+        unverified = sorted(set(range(num_endpoints)) - set(shard_endpoints))
+        if unverified:
+            logging.warning(f"Chưa xác nhận được shard {unverified}; kết quả có thể chỉ từ một phần index.")
+        else:
+            logging.info(f"Đã xác nhận {num_endpoints} shard worker phủ đủ index.")
+        return shard_endpoints
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
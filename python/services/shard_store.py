@@ -0,0 +1,89 @@
+# Chia index FAISS thành N shard theo MongoDB _id.
+# Mỗi shard gồm một file index (shard_<i>.bin) và một bản đồ ID (id_mapping_<i>.pkl)
+# ánh xạ vị trí trong index của shard về lại _id của document gốc.
+# Cùng một _id luôn rơi vào cùng một shard (crc32(_id) % N), nên có thể build lại từng phần.
+
+import os
+import json
+import zlib
+import pickle
+import logging
+import faiss
+import numpy as np
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SHARD_DIR = os.path.join(os.path.dirname(__file__), '..', 'vector_store', 'shards')
+# Ghi số shard của lần build; worker báo lại qua /health để coordinator kiểm tra SHARD_ENDPOINTS
+MANIFEST_NAME = 'shards.json'
+
+
+def shard_for_id(mongo_id: str, num_shards: int) -> int:
+    """Trả về shard chứa document có _id cho trước."""
+    return zlib.crc32(str(mongo_id).encode('utf-8')) % num_shards
+
+
+def shard_paths(shard_id: int, shard_dir: str = SHARD_DIR) -> tuple:
+    """Trả về (index_path, mapping_path) của một shard."""
+    index_path = os.path.join(shard_dir, f'shard_{shard_id}.bin')
+    mapping_path = os.path.join(shard_dir, f'id_mapping_{shard_id}.pkl')
+    return index_path, mapping_path
+
+
+def read_num_shards(shard_dir: str = SHARD_DIR):
+    """Trả về số shard ghi trong manifest, hoặc None nếu không có manifest."""
+    manifest_path = os.path.join(shard_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('num_shards')
+
+
+def write_shards(embeddings: np.ndarray, mongo_ids: list, num_shards: int, shard_dir: str = SHARD_DIR) -> list:
+    """Phân vùng embeddings theo _id và ghi mỗi phần thành một IndexFlatL2 riêng.
+
+    Trả về danh sách số vector trong từng shard.
+    """
+    if num_shards < 1:
+        raise ValueError(f"num_shards phải >= 1 (nhận được {num_shards})")
+    if embeddings.shape[0] != len(mongo_ids):
+        raise ValueError(f"Số embeddings ({embeddings.shape[0]}) không khớp với số ID ({len(mongo_ids)})")
+
+    os.makedirs(shard_dir, exist_ok=True)
+    embedding_dim = embeddings.shape[1]
+
+    buckets = [[] for _ in range(num_shards)]
+    for row, mongo_id in enumerate(mongo_ids):
+        buckets[shard_for_id(mongo_id, num_shards)].append(row)
+
+    sizes = []
+    for shard_id, rows in enumerate(buckets):
+        index_path, mapping_path = shard_paths(shard_id, shard_dir)
+        index = faiss.IndexFlatL2(embedding_dim)
+        if rows:
+            index.add(np.ascontiguousarray(embeddings[rows], dtype='float32'))
+        faiss.write_index(index, index_path)
+
+        id_mapping = {i: mongo_ids[row] for i, row in enumerate(rows)}
+        with open(mapping_path, 'wb') as f:
+            pickle.dump(id_mapping, f)
+
+        logging.info(f"Đã ghi shard {shard_id}: {index.ntotal} vector -> {index_path}")
+        sizes.append(index.ntotal)
+
+    with open(os.path.join(shard_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'num_shards': num_shards, 'sizes': sizes}, f)
+
+    # Xoá shard cũ còn sót lại nếu lần build trước dùng nhiều shard hơn
+    stale_id = num_shards
+    while True:
+        stale_paths = [p for p in shard_paths(stale_id, shard_dir) if os.path.exists(p)]
+        if not stale_paths:
+            break
+        for p in stale_paths:
+            os.remove(p)
+        logging.info(f"Đã xoá shard cũ {stale_id}.")
+        stale_id += 1
+
+    return sizes
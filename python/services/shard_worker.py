@@ -0,0 +1,181 @@
+# Shard worker: tải một shard FAISS và phục vụ tìm kiếm qua HTTP.
+# Coordinator (services/shard_coordinator.py) gửi embedding của câu hỏi tới mọi worker song song
+# và gộp top-k của từng shard lại theo score.
+#
+# Chạy một worker (từ thư mục python/):
+#   python -m services.shard_worker --shard-id 0 --port 5101
+# Chạy N worker cục bộ (mỗi shard một process) để thử nghiệm:
+#   python -m services.shard_worker --local 4 --port 5101
+
+import os
+import sys
+import time
+import pickle
+import logging
+import argparse
+import subprocess
+import faiss
+import numpy as np
+import requests
+from flask import Flask, request, jsonify
+from services.shard_store import SHARD_DIR, shard_paths, read_num_shards
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PYTHON_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class ShardSearcher:
+    def __init__(self, shard_id: int, shard_dir: str = SHARD_DIR):
+        self.shard_id = shard_id
+        self.index_path, self.mapping_path = shard_paths(shard_id, shard_dir)
+
+        logging.info(f"Đang tải shard {shard_id} từ: {self.index_path}")
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"Không tìm thấy file index của shard tại: {self.index_path}")
+        if not os.path.exists(self.mapping_path):
+            raise FileNotFoundError(f"Không tìm thấy file mapping của shard tại: {self.mapping_path}")
+
+        self.index = faiss.read_index(self.index_path)
+        self.num_shards = read_num_shards(shard_dir)
+        with open(self.mapping_path, 'rb') as f:
+            self.id_mapping = pickle.load(f)
+
+        if self.index.ntotal != len(self.id_mapping):
+            logging.warning(f"Shard {shard_id}: số vector ({self.index.ntotal}) không khớp với số ID ({len(self.id_mapping)}).")
+        logging.info(f"Shard {shard_id} sẵn sàng. Tổng số vector: {self.index.ntotal}")
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> list:
+        """Trả về tối đa top_k kết quả [{'id', 'score'}] của shard, score giảm dần."""
+        if self.index.ntotal == 0:
+            return []
+
+        query_embedding = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+        distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
+
+        results = []
+        for distance, idx in zip(distances[0], indices[0]):
+            if idx == -1:
+                continue
+            mongo_id = self.id_mapping.get(int(idx))
+            if not mongo_id:
+                logging.warning(f"Shard {self.shard_id}: không tìm thấy MongoDB ID cho FAISS index {idx}.")
+                continue
+            # Cùng công thức với RetrieverService để score giữa các shard so sánh được
+            results.append({'id': mongo_id, 'score': float(1.0 - distance)})
+        return results
+
+
+def create_app(searcher: ShardSearcher) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/search', methods=['POST'])
+    def handle_search():
+        data = request.get_json(silent=True)
+        if not data or 'embedding' not in data:
+            return jsonify({"error": "Thiếu trường 'embedding' trong yêu cầu JSON."}), 400
+
+        top_k = int(data.get('top_k', 5))
+        started = time.perf_counter()
+        try:
+            results = searcher.search(data['embedding'], top_k)
+        except Exception as e:
+            logging.error(f"Shard {searcher.shard_id}: lỗi khi tìm kiếm: {e}", exc_info=True)
+            return jsonify({"error": "Lỗi khi tìm kiếm trong shard."}), 500
+
+        return jsonify({
+            "shard_id": searcher.shard_id,
+            "results": results,
+            "search_ms": (time.perf_counter() - started) * 1000,
+        })
+
+    @app.route('/health', methods=['GET'])
+    def handle_health():
+        return jsonify({"shard_id": searcher.shard_id, "num_shards": searcher.num_shards, "ntotal": int(searcher.index.ntotal)})
+
+    return app
+
+
+def launch_local_workers(num_shards: int, base_port: int, shard_dir: str = SHARD_DIR, faiss_threads: int = None) -> tuple:
+    """Khởi động mỗi shard trong một process riêng trên localhost.
+
+    Trả về (processes, endpoints). Người gọi chịu trách nhiệm terminate các process.
+    """
+    if faiss_threads is None:
+        # Chia đều CPU cho các worker để các process không tranh nhau thread OpenMP
+        faiss_threads = max(1, (os.cpu_count() or 1) // num_shards)
+
+    processes, endpoints = [], []
+    for shard_id in range(num_shards):
+        port = base_port + shard_id
+        cmd = [
+            sys.executable, '-m', 'services.shard_worker',
+            '--shard-id', str(shard_id),
+            '--port', str(port),
+            '--host', '127.0.0.1',
+            '--shard-dir', shard_dir,
+            '--threads', str(faiss_threads),
+        ]
+        processes.append(subprocess.Popen(cmd, cwd=PYTHON_ROOT))
+        endpoints.append(f'http://127.0.0.1:{port}')
+    logging.info(f"Đã khởi động {num_shards} shard worker cục bộ: {', '.join(endpoints)}")
+    return processes, endpoints
+
+
+def wait_until_ready(endpoints: list, timeout: float = 60.0) -> bool:
+    """Chờ tới khi mọi worker trả lời /health hoặc hết thời gian."""
+    deadline = time.monotonic() + timeout
+    pending = list(endpoints)
+    while pending and time.monotonic() < deadline:
+        for endpoint in list(pending):
+            try:
+                if requests.get(f'{endpoint}/health', timeout=1).ok:
+                    pending.remove(endpoint)
+            except requests.RequestException:
+                pass
+        if pending:
+            time.sleep(0.2)
+    if pending:
+        logging.error(f"Các shard worker chưa sẵn sàng: {', '.join(pending)}")
+    return not pending
+
+
+def stop_local_workers(processes: list):
+    for p in processes:
+        p.terminate()
+    for p in processes:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shard worker phục vụ tìm kiếm FAISS qua HTTP.")
+    parser.add_argument('--shard-id', type=int, default=int(os.environ.get('SHARD_ID', 0)))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SHARD_PORT', 5101)))
+    parser.add_argument('--host', default=os.environ.get('SHARD_HOST', '0.0.0.0'))
+    parser.add_argument('--shard-dir', default=os.environ.get('SHARD_DIR', SHARD_DIR))
+    parser.add_argument('--threads', type=int, default=None, help="Số thread OpenMP cho FAISS.")
+    parser.add_argument('--local', type=int, default=0, metavar='N',
+                        help="Khởi động N worker cục bộ (shard 0..N-1) trên các port liên tiếp từ --port.")
+    args = parser.parse_args()
+
+    if args.local:
+        processes, endpoints = launch_local_workers(args.local, args.port, args.shard_dir, args.threads)
+        print(f"SHARD_ENDPOINTS={','.join(endpoints)}")
+        try:
+            for p in processes:
+                p.wait()
+        except KeyboardInterrupt:
+            logging.info("Đang dừng các shard worker...")
+        finally:
+            stop_local_workers(processes)
+    else:
+        if args.threads:
+            faiss.omp_set_num_threads(args.threads)
+        searcher = ShardSearcher(args.shard_id, args.shard_dir)
+        app = create_app(searcher)
+        logging.info(f"Shard worker {args.shard_id} đang khởi động tại http://{args.host}:{args.port}")
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
@@ -0,0 +1,40 @@
+# RetrieverService tìm kiếm trên các shard worker (services/shard_worker.py) thay vì một index FAISS trong process.
+# Chỉ thay bước tìm kiếm (_search); threshold, fetch context và deadline dùng chung với RetrieverService.
+
+import logging
+from services.retriever import RetrieverService, EMBEDDING_MODEL, MONGO_URI, FINAL_DB_NAME, COLLECTION_NAME
+from services.shard_coordinator import ShardCoordinator, SHARD_ENDPOINTS, SHARD_TIMEOUT
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class ShardedRetrieverService(RetrieverService):
+    def __init__(self, endpoints=SHARD_ENDPOINTS, timeout=SHARD_TIMEOUT, model_name=EMBEDDING_MODEL, mongo_uri=MONGO_URI, db_name=FINAL_DB_NAME, collection_name=COLLECTION_NAME):
+        logging.info(f"Khởi tạo ShardedRetrieverService với {len(endpoints)} shard...")
+        self.endpoints = endpoints
+        self.shard_timeout = timeout
+        super().__init__(model_name=model_name, mongo_uri=mongo_uri, db_name=db_name, collection_name=collection_name)
+
+    def _load_index(self):
+        self.index = None
+        self.id_mapping = None
+        self.coordinator = ShardCoordinator(self.endpoints, timeout=self.shard_timeout)
+        logging.info(f"Shard endpoints: {', '.join(self.coordinator.endpoints)}")
+        self.coordinator.verify_shards()
+
+    def _search(self, query_embedding, top_k: int, timeout: float = None) -> list:
+        # Không chờ shard lâu hơn thời hạn còn lại của request
+        timeout = self.coordinator.timeout if timeout is None else min(self.coordinator.timeout, timeout)
+
+        logging.info(f"Đang tìm kiếm {top_k} kết quả gần nhất trên {len(self.coordinator.endpoints)} shard...")
+        hits, missing_shards = self.coordinator.search(query_embedding, top_k, timeout=timeout)
+        if len(missing_shards) == len(self.coordinator.endpoints):
+            logging.error("Không shard nào trả lời, không có kết quả.")
+        elif missing_shards:
+            logging.warning(f"Kết quả chỉ từ một phần index (thiếu shard: {missing_shards}).")
+        return hits
+
+    def close_connection(self):
+        self.coordinator.close()
+        super().close_connection()
@@ -49,6 +49,8 @@ COLLECTION_NAME = "conversations"
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'vector_store', 'faiss_index.bin')
 MAPPING_PATH = os.path.join(os.path.dirname(__file__), '..', 'vector_store', 'id_mapping.pkl')
+# NUM_SHARDS > 1: ghi index thành nhiều shard (vector_store/shards/) cho ShardedRetrieverService
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", "1"))
 
 os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
 
@@ -104,7 +106,7 @@ class VectorStoreService:
             logging.error(f"Lỗi khi truy vấn hoặc chuẩn bị dữ liệu MongoDB: {e}")
             return [], []
 
-    def build_and_save_index(self, index_path=INDEX_PATH, mapping_path=MAPPING_PATH):
+    def build_and_save_index(self, index_path=INDEX_PATH, mapping_path=MAPPING_PATH, num_shards=NUM_SHARDS, shard_dir=None):
         mongo_ids, texts_to_embed  = self._fetch_data()
 
         if not texts_to_embed:
@@ -120,6 +122,19 @@ class VectorStoreService:
             logging.error(f"Lỗi trong quá trình tạo embedding: {e}")
             return 
 
+        if num_shards > 1:
+            # Import tại đây để chế độ một index vẫn chạy được bằng `python services/vector_store_service.py`;
+            # chế độ shard cần chạy bằng `python -m services.vector_store_service` từ thư mục python/
+            from services.shard_store import SHARD_DIR, write_shards
+            shard_dir = shard_dir or SHARD_DIR
+            logging.info(f"Đang chia index thành {num_shards} shard theo _id...")
+            try:
+                sizes = write_shards(embeddings, mongo_ids, num_shards, shard_dir)
+                logging.info(f"Đã ghi {num_shards} shard vào {shard_dir}. Số vector mỗi shard: {sizes}")
+            except (faiss.FaissException, IOError, ValueError) as e:
+                logging.error(f"Lỗi khi ghi các shard: {e}")
+            return
+
         logging.info(f"Đang xây dựng FAISS index (IndexFlatL2)...")
         try:
             index = faiss.IndexFlatL2(self.embedding_dim)
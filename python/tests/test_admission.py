@@ -0,0 +1,152 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.admission import (
+    DEADLINE_HEADER, AdmissionController, AdmissionRejected, Deadline, DeadlineExceeded, StageBudget, run_with_deadline,
+)
+
+
+def deadline_in(seconds):
+    return Deadline(time.monotonic() + seconds)
+
+
+def wait_for_queued(controller, count, timeout=2.0):
+    stop = time.monotonic() + timeout
+    while controller.snapshot()['queued'] < count:
+        assert time.monotonic() < stop, "request chưa vào hàng đợi"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('value', ['nan', 'NaN', 'inf', '-inf', '-5', 'abc', ''])
+def test_deadline_from_headers_ignores_invalid_budget(value):
+    deadline = Deadline.from_headers({DEADLINE_HEADER: value})
+    assert deadline.expires_at is None
+    assert deadline.remaining() == float('inf')
+
+
+def test_deadline_from_headers_uses_budget_ms():
+    deadline = Deadline.from_headers({DEADLINE_HEADER: '1500'})
+    assert 1.0 < deadline.remaining() <= 1.5
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_concurrent=1, max_queued=1, queue_timeout=5.0)
+    controller.acquire(Deadline())
+
+    # Người chờ sẽ được nhận khi slot được nhả; chỉ cần nó chiếm chỗ trong hàng đợi
+    waiter = threading.Thread(target=controller.acquire, args=(Deadline(),))
+    waiter.start()
+    wait_for_queued(controller, 1)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire(Deadline())
+    assert time.monotonic() - started < 0.1
+    assert excinfo.value.reason == 'queue_full'
+    assert excinfo.value.status == 503
+    assert excinfo.value.retry_after >= 1
+    assert controller.snapshot()['rejected']['queue_full'] == 1
+
+    controller.release(0.1)
+    waiter.join(timeout=2.0)
+    assert controller.snapshot()['in_flight'] == 1
+
+
+def test_rejects_on_queue_timeout_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queued=4, queue_timeout=0.1)
+    controller.acquire(Deadline())
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire(Deadline())
+    assert excinfo.value.reason == 'queue_timeout'
+    assert excinfo.value.retry_after >= 1
+
+    snapshot = controller.snapshot()
+    assert snapshot['rejected']['queue_timeout'] == 1
+    assert snapshot['queued'] == 0
+    assert snapshot['queue_wait_ms']['max'] >= 100
+
+
+def test_expires_when_deadline_passes_in_queue():
+    controller = AdmissionController(max_concurrent=1, max_queued=4, queue_timeout=5.0)
+    controller.acquire(Deadline())
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as excinfo:
+        controller.acquire(deadline_in(0.1))
+    assert excinfo.value.stage == 'queue'
+    assert time.monotonic() - started < 1.0
+    assert controller.snapshot()['expired'] == {'queue': 1}
+    assert controller.snapshot()['rejected'] == {'queue_full': 0, 'queue_timeout': 0}
+
+
+def test_stops_waiting_when_budget_no_longer_covers_reserve():
+    controller = AdmissionController(max_concurrent=1, max_queued=4, queue_timeout=5.0)
+    controller.acquire(Deadline())
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        controller.acquire(deadline_in(0.5), reserve=0.4)
+    # Bỏ cuộc khi chỉ còn ~reserve giây, không chờ tới khi hết hẳn deadline
+    assert time.monotonic() - started < 0.3
+
+
+def test_expires_immediately_when_budget_below_reserve_even_with_free_slot():
+    controller = AdmissionController(max_concurrent=2, max_queued=4, queue_timeout=5.0)
+    with pytest.raises(DeadlineExceeded):
+        controller.acquire(deadline_in(0.2), reserve=1.0)
+    snapshot = controller.snapshot()
+    assert snapshot['in_flight'] == 0
+    assert snapshot['admitted'] == 0
+    assert snapshot['expired'] == {'queue': 1}
+
+
+def test_admit_releases_slot_for_next_waiter():
+    controller = AdmissionController(max_concurrent=1, max_queued=4, queue_timeout=2.0)
+    admitted = []
+
+    def work():
+        with controller.admit(Deadline()):
+            admitted.append(threading.current_thread().name)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=2.0)
+    snapshot = controller.snapshot()
+    assert len(admitted) == 3
+    assert snapshot['completed'] == 3
+    assert snapshot['in_flight'] == 0
+
+
+def test_stage_budget_skips_ewma_update_on_deadline_exceeded():
+    budget = StageBudget({'generate': 5.0})
+    with pytest.raises(DeadlineExceeded):
+        with budget.measure('generate'):
+            raise DeadlineExceeded('generate', 0.0)
+    assert budget.estimate('generate') == 5.0
+
+    with budget.measure('generate'):
+        pass
+    assert budget.estimate('generate') < 5.0
+
+
+def test_run_with_deadline_returns_result_in_time():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert run_with_deadline(executor, deadline_in(1.0), 'translate', lambda x: x * 2, 21) == 42
+
+
+def test_run_with_deadline_aborts_hung_call():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded) as excinfo:
+            run_with_deadline(executor, deadline_in(0.1), 'translate', release.wait, 5.0)
+        assert excinfo.value.stage == 'translate'
+        assert time.monotonic() - started < 0.5
+        release.set()
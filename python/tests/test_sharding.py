@@ -0,0 +1,215 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import faiss
+import numpy as np
+import pytest
+
+from services.shard_store import shard_for_id, shard_paths, write_shards, read_num_shards
+from services.shard_worker import ShardSearcher
+from services.shard_coordinator import ShardCoordinator, ShardTimeout
+
+
+NUM_SHARDS = 4
+
+
+def make_corpus(num_docs=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num_docs, dim)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    mongo_ids = [f'{i:024x}' for i in range(num_docs)]
+    return embeddings, mongo_ids
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    embeddings, mongo_ids = make_corpus()
+    write_shards(embeddings, mongo_ids, NUM_SHARDS, str(tmp_path))
+    return embeddings, mongo_ids, str(tmp_path)
+
+
+def local_coordinator(shard_dir, **kwargs):
+    """Coordinator gọi thẳng ShardSearcher thay vì HTTP; endpoint là chỉ số shard."""
+    searchers = [ShardSearcher(i, shard_dir) for i in range(NUM_SHARDS)]
+    coordinator = ShardCoordinator([str(i) for i in range(NUM_SHARDS)], **kwargs)
+    coordinator._query_shard = lambda endpoint, embedding, top_k, timeout: searchers[int(endpoint)].search(embedding, top_k)
+    return coordinator
+
+
+def test_shard_for_id_is_stable_and_in_range():
+    for i in range(100):
+        mongo_id = f'{i:024x}'
+        shard_id = shard_for_id(mongo_id, NUM_SHARDS)
+        assert 0 <= shard_id < NUM_SHARDS
+        assert shard_for_id(mongo_id, NUM_SHARDS) == shard_id
+
+
+def test_write_shards_partitions_every_id_once(corpus):
+    _, mongo_ids, shard_dir = corpus
+    assert read_num_shards(shard_dir) == NUM_SHARDS
+
+    seen = []
+    for shard_id in range(NUM_SHARDS):
+        searcher = ShardSearcher(shard_id, shard_dir)
+        assert searcher.index.ntotal == len(searcher.id_mapping)
+        for mongo_id in searcher.id_mapping.values():
+            assert shard_for_id(mongo_id, NUM_SHARDS) == shard_id
+        seen.extend(searcher.id_mapping.values())
+    assert sorted(seen) == sorted(mongo_ids)
+
+
+def test_write_shards_removes_stale_shards(tmp_path):
+    embeddings, mongo_ids = make_corpus(num_docs=20)
+    write_shards(embeddings, mongo_ids, 4, str(tmp_path))
+    write_shards(embeddings, mongo_ids, 2, str(tmp_path))
+    for shard_id in (2, 3):
+        assert not any(p for p in shard_paths(shard_id, str(tmp_path)) if (tmp_path / p).exists())
+    assert read_num_shards(str(tmp_path)) == 2
+
+
+def test_sharded_top_k_matches_flat_index(corpus):
+    embeddings, mongo_ids, shard_dir = corpus
+    flat = faiss.IndexFlatL2(embeddings.shape[1])
+    flat.add(embeddings)
+    coordinator = local_coordinator(shard_dir)
+
+    queries = make_corpus(num_docs=10, seed=1)[0]
+    for query in queries:
+        distances, indices = flat.search(query.reshape(1, -1), 5)
+        expected = [mongo_ids[i] for i in indices[0]]
+
+        results, missing_shards = coordinator.search(query, 5)
+        assert missing_shards == []
+        assert [r['id'] for r in results] == expected
+        assert [r['score'] for r in results] == pytest.approx([1.0 - d for d in distances[0]], abs=1e-5)
+    coordinator.close()
+
+
+def test_failing_shard_is_reported_missing(corpus):
+    _, _, shard_dir = corpus
+    coordinator = local_coordinator(shard_dir)
+    healthy = coordinator._query_shard
+
+    def query_shard(endpoint, embedding, top_k, timeout):
+        if endpoint == '1':
+            raise ConnectionError("shard 1 down")
+        return healthy(endpoint, embedding, top_k, timeout)
+
+    coordinator._query_shard = query_shard
+    results, missing_shards = coordinator.search(make_corpus(num_docs=1, seed=1)[0][0], 5)
+    assert missing_shards == [1]
+    assert len(results) == 5
+    assert all(shard_for_id(r['id'], NUM_SHARDS) != 1 for r in results)
+    coordinator.close()
+
+
+def test_slow_shard_does_not_block_partial_results(corpus):
+    _, _, shard_dir = corpus
+    coordinator = local_coordinator(shard_dir, timeout=0.2)
+    healthy = coordinator._query_shard
+
+    def query_shard(endpoint, embedding, top_k, timeout):
+        if endpoint == '2':
+            time.sleep(1.0)
+        return healthy(endpoint, embedding, top_k, timeout)
+
+    coordinator._query_shard = query_shard
+    started = time.monotonic()
+    results, missing_shards = coordinator.search(make_corpus(num_docs=1, seed=1)[0][0], 5)
+    assert time.monotonic() - started < 0.8
+    assert missing_shards == [2]
+    assert results
+    coordinator.close()
+
+
+class DripHandler(BaseHTTPRequestHandler):
+    """Trả lời từng byte một, mỗi byte cách nhau 50 ms (không bao giờ vượt read timeout)."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        try:
+            for _ in range(60):
+                self.wfile.write(b' ')
+                self.wfile.flush()
+                time.sleep(0.05)
+            self.wfile.write(b'{"results": []}')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def test_query_shard_bounds_total_time_for_dripping_shard():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DripHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+    coordinator = ShardCoordinator([endpoint])
+    try:
+        started = time.monotonic()
+        with pytest.raises(ShardTimeout):
+            coordinator._query_shard(endpoint, [0.0], 5, 0.3)
+        assert time.monotonic() - started < 1.0
+    finally:
+        coordinator.close()
+        server.shutdown()
+
+
+class FakeResponse:
+    def __init__(self, info):
+        self.info = info
+
+    def raise_for_status(self):
+        if self.info is None:
+            raise ConnectionError("unreachable")
+
+    def json(self):
+        return self.info
+
+
+class FakeSession:
+    def __init__(self, health):
+        self.health = health
+
+    def get(self, url, timeout):
+        return FakeResponse(self.health.get(url.rsplit('/health', 1)[0]))
+
+
+def coordinator_with_health(health):
+    coordinator = ShardCoordinator(list(health))
+    coordinator._local.session = FakeSession(health)
+    return coordinator
+
+
+def test_verify_shards_accepts_full_cover():
+    health = {f'http://s{i}': {'shard_id': i, 'num_shards': 3} for i in (2, 0, 1)}
+    coordinator = coordinator_with_health(health)
+    assert coordinator.verify_shards() == {2: 'http://s2', 0: 'http://s0', 1: 'http://s1'}
+    coordinator.close()
+
+
+def test_verify_shards_rejects_duplicate_shard():
+    health = {'http://a': {'shard_id': 0, 'num_shards': 2}, 'http://b': {'shard_id': 0, 'num_shards': 2}}
+    coordinator = coordinator_with_health(health)
+    with pytest.raises(ValueError):
+        coordinator.verify_shards()
+    coordinator.close()
+
+
+def test_verify_shards_rejects_fewer_endpoints_than_built():
+    health = {f'http://s{i}': {'shard_id': i, 'num_shards': 4} for i in range(3)}
+    coordinator = coordinator_with_health(health)
+    with pytest.raises(ValueError):
+        coordinator.verify_shards()
+    coordinator.close()
+
+
+def test_verify_shards_only_warns_for_unreachable_worker():
+    health = {'http://s0': {'shard_id': 0, 'num_shards': 2}, 'http://s1': None}
+    coordinator = coordinator_with_health(health)
+    assert coordinator.verify_shards() == {0: 'http://s0'}
+    coordinator.close()